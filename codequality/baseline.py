@@ -0,0 +1,121 @@
+import hashlib
+import json
+
+
+class BaselineError(Exception):
+    """
+    Baseline file could not be read or written.
+    """
+
+
+class Baseline(object):
+    """
+    Snapshot of known findings, used to report only new errors.
+
+    Findings are stored as fingerprints of (checker, filename, message,
+    normalized source line) rather than line numbers, so they survive
+    unrelated edits that shift lines around.  Fingerprints are counted, so
+    a new copy of a known finding in the same file is still reported.
+
+    The content id of every checked file is recorded as well, along with the
+    checkers that ran on it.  Those checkers don't need to run again on files
+    whose content is unchanged since the snapshot.
+    """
+    # Begin public API
+
+    def __init__(self):
+        self.files = {}
+        self.fingerprints = {}
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+        except (IOError, ValueError), e:
+            raise BaselineError(
+                'could not read baseline "%s": %s' % (path, e))
+        if not isinstance(data, dict):
+            raise BaselineError('malformed baseline "%s".' % path)
+        if data.get('version') != cls.version:
+            raise BaselineError(
+                'unsupported baseline version in "%s".' % path)
+        for key in ('files', 'fingerprints'):
+            if not isinstance(data.get(key), dict):
+                raise BaselineError(
+                    'malformed baseline "%s": missing or invalid "%s".'
+                    % (path, key))
+        for filename, entry in data['files'].iteritems():
+            if not isinstance(entry, dict) \
+                    or not isinstance(entry.get('content_id'), basestring) \
+                    or not isinstance(entry.get('checkers'), list):
+                raise BaselineError(
+                    'malformed baseline "%s": invalid entry for "%s".'
+                    % (path, filename))
+
+        baseline = cls()
+        baseline.files = data['files']
+        baseline.fingerprints = data['fingerprints']
+        return baseline
+
+    def save(self, path):
+        data = {
+            'version': self.version,
+            'files': self.files,
+            'fingerprints': self.fingerprints,
+        }
+        try:
+            with open(path, 'w') as fp:
+                json.dump(data, fp, indent=1, sort_keys=True)
+        except IOError, e:
+            raise BaselineError(
+                'could not write baseline "%s": %s' % (path, e))
+
+    def add_file(self, filename, content_id, checker_names):
+        self.files[filename] = {
+            'content_id': content_id,
+            'checkers': sorted(checker_names),
+        }
+
+    def is_unchanged(self, filename, content_id, checker_name):
+        """
+        Return True iff filename had content_id when the snapshot was taken,
+        and checker_name ran on it.
+        """
+        entry = self.files.get(filename)
+        return entry is not None \
+            and entry['content_id'] == content_id \
+            and checker_name in entry['checkers']
+
+    def add_error(self, checker_name, err, line):
+        key = self._fingerprint(checker_name, err, line)
+        self.fingerprints[key] = self.fingerprints.get(key, 0) + 1
+
+    def suppress(self, checker_name, err, line):
+        """
+        Return True iff err is a known finding.
+
+        Each recorded fingerprint suppresses only as many errors as were
+        seen when the snapshot was taken.
+        """
+        key = self._fingerprint(checker_name, err, line)
+        count = self.fingerprints.get(key, 0)
+        if not count:
+            return False
+        self.fingerprints[key] = count - 1
+        return True
+
+    # End public API
+
+    version = 1
+
+    def _fingerprint(self, checker_name, err, line):
+        # Whitespace is normalized so re-indenting a block doesn't turn all
+        # of its known findings into new ones.
+        line_hash = hashlib.sha1(' '.join(line.split())).hexdigest()
+        return hashlib.sha1('\0'.join((
+            checker_name,
+            err['filename'],
+            err['msg'],
+            line_hash,
+        ))).hexdigest()
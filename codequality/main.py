@@ -41,6 +41,24 @@ working copy.
 All scm handlers can take a --rev flag. In the case of git, the above
 will check all relevant files created or modified (not deleted) in the
 last-committed patch. This works well as a post-commit hook.
+
+    codequality --scm git --changed-lines
+
+Adding --changed-lines limits the report to errors on lines that were
+added or modified in the working copy (or in --rev), so touching a legacy
+file doesn't bring along all of its pre-existing warnings.
+
+    codequality --write-baseline baseline.json
+    codequality --baseline baseline.json
+
+The first run above records all current errors in baseline.json without
+reporting them.  Later runs with --baseline only report errors that are not
+in the baseline, and don't rerun checkers on files whose content hasn't
+changed since those checkers ran for the baseline.  Errors are matched by
+checker, filename, message and source line, so unrelated edits that shift
+lines around don't resurface known errors.
+Filenames are relative to the current working directory, so baselines
+should be written and used from the same directory.
 """
 import commands
 import fnmatch
@@ -48,6 +66,7 @@ import optparse
 import os
 import sys
 
+import baseline
 import checkers
 import scmhandlers
 
@@ -79,13 +98,47 @@ class CodeQuality(object):
                 'no registered scm handler for "%s".'
                 % self.options.scmhandler)
 
+        if self.options.changed_lines and not self.options.scmhandler:
+            raise CommandError('--changed-lines requires --scm.')
+
+        if self.options.baseline and self.options.write_baseline:
+            raise CommandError(
+                '--baseline and --write-baseline are mutually exclusive.')
+
         paths = self._resolve_paths(*paths)
         scmhandler = scmhandlers.scmhandlers.get(
             self.options.scmhandler,
             scmhandlers.NoSCMHandler)()
         errors_exist = False
 
-        checker_to_loc_to_filename = {}
+        changed_lines = None
+        if self.options.changed_lines:
+            changed_lines = scmhandler.changed_lines(rev=self.options.rev)
+
+        try:
+            if self.options.baseline:
+                known = baseline.Baseline.load(self.options.baseline)
+            elif self.options.write_baseline:
+                known = baseline.Baseline()
+            else:
+                known = None
+        except baseline.BaselineError, e:
+            raise CommandError(e)
+
+        # Sources with identical content are only checked once: the first
+        # location seen for each content id stands in for all of its copies,
+        # and its errors are fanned out to every filename mapped to it.
+        # Copies are grouped by extension as well, since checkers are
+        # registered per extension and some tools look at it.
+        id_to_location = {}
+        checker_to_loc_to_filenames = {}
+
+        # When writing a baseline, content ids are recorded together with the
+        # checkers that actually ran, so that checkers missing when the
+        # baseline was taken still run on unchanged files once installed.
+        filename_to_content_id = {}
+        failed_checkers = set()
+
         for filename, location in scmhandler.srcs_to_check(
                 paths, rev=self.options.rev,
                 ignore_untracked=self.options.ignore_untracked):
@@ -94,24 +147,42 @@ class CodeQuality(object):
                 continue
 
             checker_classes = self._relevant_checkers(filename)
+            if not checker_classes:
+                continue
+
+            content_id = scmhandler.content_id(filename, location)
+            if known is not None:
+                if self.options.write_baseline:
+                    filename_to_content_id[filename] = content_id
+                else:
+                    checker_classes = [
+                        checker_class for checker_class in checker_classes
+                        if not known.is_unchanged(
+                            filename, content_id, checker_class.__name__)]
+                    if not checker_classes:
+                        continue
+            _, ext = os.path.splitext(filename)
+            location = id_to_location.setdefault((ext, content_id), location)
+
             for checker_class in checker_classes:
-                loc_to_filename = checker_to_loc_to_filename.setdefault(
+                loc_to_filenames = checker_to_loc_to_filenames.setdefault(
                     checker_class, {})
-                loc_to_filename[location] = filename
+                loc_to_filenames.setdefault(location, []).append(filename)
 
-        for checker_class, loc_to_filename \
-                in checker_to_loc_to_filename.iteritems():
-            locations = loc_to_filename.keys()
+        for checker_class, loc_to_filenames \
+                in checker_to_loc_to_filenames.iteritems():
+            locations = loc_to_filenames.keys()
 
             # TODO: this should only be printed if the checker is actually
             # on the path and being used.
             if self.options.verbose:
-                for location, filename in loc_to_filename.iteritems():
-                    print '[%s] "%s"%s' % (
-                        checker_class.__name__,
-                        filename,
-                        '' if location == filename
-                        else (' using "%s"' % location))
+                for location, filenames in loc_to_filenames.iteritems():
+                    for filename in filenames:
+                        print '[%s] "%s"%s' % (
+                            checker_class.__name__,
+                            filename,
+                            '' if location == filename
+                            else (' using "%s"' % location))
 
             # We allow missing checkers by design. Users can use
             # `--list-checkers` to verify that all desired checkers are
@@ -124,12 +195,51 @@ class CodeQuality(object):
             try:
                 errs = checker_class().check(locations)
             except OSError:
+                failed_checkers.add(checker_class)
                 continue
 
-            for err in errs:
-                errors_exist = True
-                err['filename'] = loc_to_filename[err['filename']]
-                print self.out_fmt % err
+            # Source lines are only needed to fingerprint errors against the
+            # baseline, and are read at most once per location and checker.
+            loc_to_lines = {}
+
+            for loc_err in errs:
+                location = loc_err['filename']
+
+                line = ''
+                if known is not None:
+                    if location not in loc_to_lines:
+                        loc_to_lines[location] = self._read_lines(location)
+                    lines = loc_to_lines[location]
+                    if 0 < loc_err['lineno'] <= len(lines):
+                        line = lines[loc_err['lineno'] - 1]
+
+                for filename in loc_to_filenames[location]:
+                    err = dict(loc_err, filename=filename)
+
+                    if known is not None:
+                        if self.options.write_baseline:
+                            known.add_error(checker_class.__name__, err, line)
+                            continue
+                        if known.suppress(checker_class.__name__, err, line):
+                            continue
+
+                    if not self._on_changed_line(err, changed_lines):
+                        continue
+                    errors_exist = True
+                    print self.out_fmt % err
+
+        if self.options.write_baseline:
+            for filename, content_id in filename_to_content_id.iteritems():
+                checker_names = [
+                    checker_class.__name__
+                    for checker_class in self._relevant_checkers(filename)
+                    if checker_class not in failed_checkers]
+                if checker_names:
+                    known.add_file(filename, content_id, checker_names)
+            try:
+                known.save(self.options.write_baseline)
+            except baseline.BaselineError, e:
+                raise CommandError(e)
         return errors_exist
 
     # End public API
@@ -200,6 +310,30 @@ class CodeQuality(object):
                 version,
             )
 
+    def _on_changed_line(self, err, changed_lines):
+        """
+        Return True iff err falls on a line in changed_lines.
+
+        Files without an entry in changed_lines (e.g. untracked files) are
+        considered changed in their entirety.
+        """
+        if changed_lines is None:
+            return True
+        line_index = changed_lines.get(err['filename'])
+        if line_index is None:
+            return True
+        return err['lineno'] in line_index
+
+    def _read_lines(self, path):
+        """
+        Return the lines of path, or an empty list if it can't be read.
+        """
+        try:
+            with open(path) as fp:
+                return fp.read().splitlines()
+        except IOError:
+            return []
+
     def _should_ignore(self, path):
         """
         Return True iff path should be ignored.
@@ -247,6 +381,25 @@ def main():
         help='Ignore untracked files (only applicable if using scm).',
     )
 
+    parser.add_option(
+        '--changed-lines', dest='changed_lines',
+        action='store_true', default=False,
+        help='Only report errors on lines changed in the working copy '
+             'or in --rev. Used with --scm.',
+    )
+
+    parser.add_option(
+        '--baseline', dest='baseline',
+        action='store', default=None, metavar='FILE',
+        help='Only report errors not recorded in baseline FILE.',
+    )
+    parser.add_option(
+        '--write-baseline', dest='write_baseline',
+        action='store', default=None, metavar='FILE',
+        help='Record all current errors in baseline FILE instead of '
+             'reporting them.',
+    )
+
     options, paths = parser.parse_args()
 
     try:
@@ -1,5 +1,7 @@
 import atexit
+import bisect
 import commands
+import hashlib
 import os
 import re
 import tempfile
@@ -19,7 +21,7 @@ def register(name):
 
 
 class SCMHandler(object):
-    def srcs_to_check(self, paths, rev=None):
+    def srcs_to_check(self, paths, rev=None, ignore_untracked=False):
         """ Yields (filename, src path to check) for relevant paths at rev.
 
         What is "relevant" and how to interpret "rev" are determined by
@@ -38,12 +40,53 @@ class SCMHandler(object):
         # Sub-classes must implement this method
         raise NotImplementedError()
 
+    def changed_lines(self, rev=None):
+        """ Return dict of filename -> LineIndex of lines changed at rev.
+
+        Filenames missing from the result (e.g. untracked files) should be
+        treated as changed in their entirety.  Handlers that have no notion
+        of changed lines return None, meaning every line counts as changed.
+        """
+        return None
+
+    def content_id(self, filename, location):
+        """ Return an id for the content of the src at location.
+
+        Sources with equal content have equal ids.  The default
+        implementation hashes the content the same way git hashes blobs.
+        """
+        with open(location) as fp:
+            return _blob_id(fp.read())
+
+
+class LineIndex(object):
+    """
+    Compact index of changed line intervals for a single file.
+
+    Intervals are inclusive (start, end) line number pairs.  Overlapping and
+    adjacent intervals are merged on construction, so lookups are a single
+    bisect over the interval starts.
+    """
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._ends = []
+        for start, end in sorted(intervals):
+            if self._ends and start <= self._ends[-1] + 1:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    def __contains__(self, lineno):
+        i = bisect.bisect_right(self._starts, lineno) - 1
+        return i >= 0 and lineno <= self._ends[i]
+
 
 class NoSCMHandler(SCMHandler):
     """
     Simple no-scm handler. Checks all paths provided.
     """
-    def srcs_to_check(self, paths, rev=None):
+    def srcs_to_check(self, paths, rev=None, ignore_untracked=False):
         for path in sorted(paths):
             yield (path, path)
 
@@ -67,6 +110,9 @@ class GitHandler(SCMHandler):
     """
     # Begin public API
 
+    def __init__(self):
+        self._path_to_blob_id = {}
+
     def srcs_to_check(self, limit_paths, rev=None, ignore_untracked=False):
         rev = self._resolve_rev(rev)
 
@@ -77,14 +123,103 @@ class GitHandler(SCMHandler):
         if limit_paths:
             relative_paths = set(relative_paths).intersection(limit_paths)
 
+        # Paths at a rev that share a blob share a single temp file.
+        self._path_to_blob_id = self._blob_ids_in_rev(rev, relative_paths) \
+            if rev else {}
+        blob_id_to_location = {}
+
         for path in sorted(relative_paths):
             if rev:
-                yield (
-                    path,
-                    _temp_filename(self._file_contents(path, rev=rev)))
+                blob_id = self._path_to_blob_id.get(path)
+                location = blob_id_to_location.get(blob_id)
+                if location is None:
+                    location = _temp_filename(
+                        self._file_contents(path, rev=rev))
+                    if blob_id is not None:
+                        blob_id_to_location[blob_id] = location
+                yield (path, location)
             else:
                 yield (path, path)
 
+    def content_id(self, filename, location):
+        """
+        Use the blob id recorded at rev if there is one, rather than hashing
+        the source again.
+        """
+        blob_id = self._path_to_blob_id.get(filename)
+        if blob_id is not None:
+            return blob_id
+        return super(GitHandler, self).content_id(filename, location)
+
+    def changed_lines(self, rev=None):
+        """
+        Collect changed line intervals from the git diff hunks of `rev`, or
+        of the working copy against HEAD if no `rev` is given.
+        """
+        rev = self._resolve_rev(rev)
+
+        diff_opts = ' '.join((
+            '-U0',  # only changed lines, no context
+            '-M',
+            '--no-color',
+            '--no-ext-diff',
+            '--ignore-submodules',
+            '--relative',
+            '--src-prefix=a/',
+            '--dst-prefix=b/',
+        ))
+        if rev:
+            cmd = 'diff-tree -p -r --root --no-commit-id %s %s' % (
+                diff_opts, rev)
+        else:
+            cmd = 'diff %s HEAD' % diff_opts
+        diff_output = self._git_cmd(cmd)
+
+        path_to_intervals = {}
+        intervals = None
+        in_header = False
+        for line in diff_output.splitlines():
+            # File headers are only looked for between a "diff --git" line
+            # and the first hunk, since hunk bodies can contain anything.
+            #
+            # Every file in the diff gets an entry, even without hunks (e.g.
+            # pure renames and mode changes), so that only files missing from
+            # the diff are considered changed in their entirety.
+            if line.startswith('diff --git '):
+                in_header = True
+                path = self._diff_header_path(line)
+                intervals = None if path is None \
+                    else path_to_intervals.setdefault(path, [])
+                continue
+
+            if in_header:
+                path = None
+                match = self.GIT_DIFF_RENAME_RE.match(line)
+                if match:
+                    path = _unquote_path(match.group('path'))
+                match = self.GIT_DIFF_FILE_RE.match(line)
+                if match and match.group('path') is not None:
+                    path = _unquote_path(match.group('path'))
+                    path = path[2:] if path.startswith('b/') else None
+                if path is not None:
+                    intervals = path_to_intervals.setdefault(path, [])
+                if not line.startswith('@@ '):
+                    continue
+                in_header = False
+
+            match = self.GIT_DIFF_HUNK_RE.match(line)
+            if match and intervals is not None:
+                start = int(match.group('start'))
+                count = match.group('count')
+                count = 1 if count is None else int(count)
+                # Hunks with a count of 0 are pure deletions
+                if count:
+                    intervals.append((start, start + count - 1))
+
+        return dict(
+            (path, LineIndex(intervals))
+            for path, intervals in path_to_intervals.iteritems())
+
     # End public API
 
     GIT_COMMIT_FMT = r'(?P<commit>[0-9a-f]{40})'
@@ -92,6 +227,28 @@ class GitHandler(SCMHandler):
     GIT_DIFF_SUMMARY_RE = re.compile(
         r'^ (?P<type>\w+) mode (?P<mode>\w+) (?P<path>.+)')
     GIT_SUBMODULE_MODE = 160000
+    GIT_DIFF_FILE_RE = re.compile(r'^\+\+\+ (?:/dev/null|(?P<path>.+))$')
+    GIT_DIFF_RENAME_RE = re.compile(r'^rename to (?P<path>.+)$')
+    GIT_DIFF_HUNK_RE = re.compile(
+        r'^@@ -\d+(?:,\d+)? \+(?P<start>\d+)(?:,(?P<count>\d+))? @@')
+
+    def _diff_header_path(self, line):
+        """
+        Get the path from a "diff --git a/<path> b/<path>" line.
+
+        Returns None when the old and new paths differ (renames are picked
+        up from the "rename to" line instead).
+        """
+        paths = line[len('diff --git '):]
+        half = len(paths) // 2
+        if paths[half:half + 1] != ' ':
+            return None
+        old_path = _unquote_path(paths[:half])
+        new_path = _unquote_path(paths[half + 1:])
+        if old_path.startswith('a/') and new_path.startswith('b/') \
+                and old_path[2:] == new_path[2:]:
+            return new_path[2:]
+        return None
 
     def _add_and_modified_in_working_copy(self, ignore_untracked=False):
         inside_work_tree = \
@@ -161,6 +318,31 @@ class GitHandler(SCMHandler):
 
         return result
 
+    def _blob_ids_in_rev(self, rev, paths):
+        """
+        Map `paths` (relative to the current working directory) to blob ids
+        at `rev`.
+        """
+        result = {}
+
+        # Without paths, `git ls-tree` would list the whole tree
+        if not paths:
+            return result
+
+        # -z keeps git from quoting unusual paths
+        ls_tree_output = self._git_cmd('ls-tree -r -z %s -- %s' % (
+            rev, ' '.join('"%s"' % path for path in sorted(paths))))
+
+        for entry in ls_tree_output.split('\0'):
+            if not entry:
+                continue
+            info, path = entry.split('\t', 1)
+            _, obj_type, obj_id = info.split()
+            if obj_type == 'blob':
+                result[path] = obj_id
+
+        return result
+
     def _file_contents(self, path, rev=None):
         """
         Get content of `path` at `rev`.
@@ -206,6 +388,28 @@ class GitHandler(SCMHandler):
             raise GitError('"%s" failed:\n%s' % (cmd, output))
         return output
 
+
+def _unquote_path(path):
+    """
+    Undo git's quoting of unusual paths in diff output.
+
+    Git wraps such paths in double quotes and uses C-style escapes inside
+    them (e.g. "\\303\\251" for an e-acute in UTF-8), which match Python's
+    string escapes.
+    """
+    if len(path) > 1 and path.startswith('"') and path.endswith('"'):
+        return path[1:-1].decode('string_escape')
+    return path
+
+
+def _blob_id(contents):
+    """
+    Compute the git blob id of `contents`.
+    """
+    return hashlib.sha1(
+        'blob %d\0%s' % (len(contents), contents)).hexdigest()
+
+
 _files_to_cleanup = []
 
 